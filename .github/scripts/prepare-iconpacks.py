@@ -1,148 +1,260 @@
 import os
 import re
 import sys
+import mmap
+import hashlib
 import shutil
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 LOGGER = logging.getLogger(__name__)
 
+# Hot loops build paths with '/' directly; this script only runs on POSIX CI
+if os.sep != '/':
+    LOGGER.error("Error: a POSIX path separator is required, found: %s", os.sep)
+    sys.exit(1)
+
 iconpacks_dir = './iconpacks'
 drawable_dir = './app/src/main/res/drawable'
 arrays_file = './app/src/main/res/values/arrays.xml'
 manifest_file = './app/src/main/AndroidManifest.xml'
 
-VALID_DRAWABLE_EXTENSIONS = ['.xml', '.png', '.jpg', '.jpeg', '.webp']
+VALID_DRAWABLE_EXTENSIONS = frozenset({'.xml', '.png', '.jpg', '.jpeg', '.webp'})
+
+COPY_WORKERS = min(32, (os.cpu_count() or 1) * 4)
 
+_SANITIZE_RE = re.compile(r'[^a-zA-Z0-9]')
+_DRAWABLE_REF_RE = re.compile(r'@drawable/([a-zA-Z0-9_]+)')
+_TREE_HASH_RE = re.compile(rb'<!-- hash: ([0-9a-f]+) -->')
 
-def normalize_package_name(package_name):
-    """Normalize specific package names."""
-    special_cases = {
-        'com.android.systemui': 'systemui',
-        'com.android.settings': 'settings'
-    }
-    return special_cases.get(package_name, package_name)
+# Package folders that are renamed to a short alias
+_PKG_ALIASES = {
+    'com.android.systemui': 'systemui',
+    'com.android.settings': 'settings'
+}
+
+_PACKS_CACHE = None
+_TREE_CACHE = None
 
 
 def get_icon_packs():
+    """Return a cached list of (pack_name, pack_name_lower) tuples."""
+    global _PACKS_CACHE
+
+    if _PACKS_CACHE is not None:
+        return _PACKS_CACHE
+
     try:
         LOGGER.info("Fetching icon packs from: %s", iconpacks_dir)
-        packs = [folder for folder in os.listdir(iconpacks_dir) if os.path.isdir(os.path.join(iconpacks_dir, folder))]
-        LOGGER.info("Found %s icon packs.", len(packs))
-        return packs
+        with os.scandir(iconpacks_dir) as entries:
+            _PACKS_CACHE = [
+                (entry.name, _SANITIZE_RE.sub('_', entry.name.lower()))
+                for entry in entries if entry.is_dir(follow_symlinks=False)
+            ]
+        LOGGER.info("Found %s icon packs.", len(_PACKS_CACHE))
+        return _PACKS_CACHE
     except Exception as e:
         LOGGER.error("Error fetching icon packs: %s", str(e))
         sys.exit(1)
 
 
-def replace_drawable_references(content, package_name, pack_name_lower):
-    search_pattern = r'@drawable/([a-zA-Z0-9_]+)'
-    
-    def replace(match):
-        drawable_name = match.group(1)
-        new_drawable_name = f"{drawable_name}_{package_name}_{pack_name_lower}"
-        LOGGER.info("Replacing %s with %s", drawable_name, new_drawable_name)
-        return f"@drawable/{new_drawable_name}"
+def _scan_tree():
+    """Scan the icon packs directory once and cache the result.
 
-    return re.sub(search_pattern, replace, content)
+    Returns a list of (pack_name, pack_name_lower, packages) tuples, where
+    packages is a list of (normalized_package, raw_package, suffix, files)
+    tuples and files is a list of (path, stem, ext, new_name) tuples for every
+    valid drawable, with ext lowercased and new_name being stem + suffix.
+    """
+    global _TREE_CACHE
 
+    if _TREE_CACHE is not None:
+        return _TREE_CACHE
 
-def update_drawable_references():
     try:
-        LOGGER.info("Updating drawable references...")
+        tree = []
 
-        for pack_name in get_icon_packs():
-            pack_name_lower = re.sub(r'[^a-zA-Z0-9]', '_', pack_name.lower())
+        for pack_name, pack_name_lower in get_icon_packs():
             pack_path = os.path.join(iconpacks_dir, pack_name)
+            packages = []
 
-            for package_name in os.listdir(pack_path):
-                package_path = os.path.join(pack_path, package_name)
+            with os.scandir(pack_path) as package_entries:
+                package_dirs = [entry for entry in package_entries if entry.is_dir(follow_symlinks=False)]
 
-                if os.path.isdir(package_path):
-                    package_name = normalize_package_name(package_name)
+            for package_entry in package_dirs:
+                package_name = _PKG_ALIASES.get(package_entry.name, package_entry.name)
+                suffix = '_' + package_name.lower() + '_' + pack_name_lower
+                files = []
 
-                    for file in os.listdir(package_path):
-                        file_extension = os.path.splitext(file)[1].lower()
+                with os.scandir(package_entry.path) as file_entries:
+                    for file_entry in file_entries:
+                        if not file_entry.is_file():
+                            continue
 
-                        if file_extension in VALID_DRAWABLE_EXTENSIONS:
-                            file_path = os.path.join(package_path, file)
+                        stem, ext = os.path.splitext(file_entry.name)
+                        ext = ext.lower()
 
-                            if file_extension == '.xml':
-                                with open(file_path, 'r') as f:
-                                    file_content = f.read()
+                        if ext in VALID_DRAWABLE_EXTENSIONS:
+                            files.append((file_entry.path, stem, ext, stem + suffix))
 
-                                updated_content = replace_drawable_references(file_content, package_name, pack_name_lower)
+                packages.append((package_name, package_entry.name, suffix, files))
 
-                                if updated_content != file_content:
-                                    with open(file_path, 'w') as f:
-                                        f.write(updated_content)
-                                    
-                                    LOGGER.info("Updated drawable references in: %s", file_path)
+            tree.append((pack_name, pack_name_lower, packages))
 
-        LOGGER.info("Drawable references updated successfully.")
+        _TREE_CACHE = tree
+        return _TREE_CACHE
     except Exception as e:
-        LOGGER.error("Error updating drawable references: %s", str(e))
+        LOGGER.error("Error scanning icon packs: %s", str(e))
         sys.exit(1)
 
 
-def copy_and_rename_files():
-    update_drawable_references()
+def hash_tree(tree):
+    """Return a digest of every drawable's path, size and mtime in sorted order."""
+    try:
+        entries = []
+
+        for _, _, packages in sorted(tree):
+            for _, _, _, files in sorted(packages):
+                for file_path, _, _, _ in sorted(files):
+                    stat = os.stat(file_path)
+                    entries.append((file_path, stat.st_size, stat.st_mtime_ns))
+
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr(entries).encode('utf-8'))
+        return h.hexdigest()
+    except Exception as e:
+        LOGGER.error("Error hashing icon packs: %s", str(e))
+        sys.exit(1)
+
 
+def drawables_present(tree):
+    """Return True if every renamed drawable already exists in drawable_dir."""
     try:
-        LOGGER.info("Starting file copy and rename process...")
+        with os.scandir(drawable_dir) as entries:
+            existing = {entry.name for entry in entries}
+    except OSError:
+        return False
 
-        # Ensure the destination directory exists
-        if not os.path.exists(drawable_dir):
-            os.makedirs(drawable_dir)
-            LOGGER.info("Created drawable directory: %s", drawable_dir)
+    return all(
+        new_name + ext in existing
+        for _, _, packages in tree
+        for _, _, _, files in packages
+        for _, _, ext, new_name in files
+    )
 
-        for pack_name in get_icon_packs():
-            pack_name_lower = re.sub(r'[^a-zA-Z0-9]', '_', pack_name.lower())
-            pack_path = os.path.join(iconpacks_dir, pack_name)
-            LOGGER.info("Processing pack: %s (%s)", pack_name, pack_name_lower)
 
-            for package_name in os.listdir(pack_path):
-                package_path = os.path.join(pack_path, package_name)
-                if os.path.isdir(package_path):
-                    package_name = normalize_package_name(package_name)
+def read_tree_hash():
+    """Return the tree hash recorded in the arrays file, if any."""
+    try:
+        with open(arrays_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            match = _TREE_HASH_RE.search(mm)
+            return match.group(1).decode('ascii') if match else None
+    except (OSError, ValueError):
+        return None
 
-                    for file in os.listdir(package_path):
-                        file_extension = os.path.splitext(file)[1].lower()
 
-                        if file_extension in VALID_DRAWABLE_EXTENSIONS:
-                            original_file_path = os.path.join(package_path, file)
-                            new_file_name = f"{os.path.splitext(file)[0]}_{package_name.lower()}_{pack_name_lower}{file_extension}"
-                            new_file_path = os.path.join(drawable_dir, new_file_name)
+def link_or_copy(src, dst):
+    """Hardlink src to dst, falling back to a regular copy across filesystems."""
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        os.remove(dst)
+        link_or_copy(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
 
-                            LOGGER.info("Copying %s to %s", original_file_path, new_file_path)
-                            shutil.copy(original_file_path, new_file_path)
 
-        LOGGER.info("File copy and rename process completed.")
+def splice_file(file_path, start_marker, end_marker, block):
+    """Replace everything between start_marker and end_marker with block.
+
+    The head and tail of the file are streamed into a temporary file which then
+    atomically replaces the original. Returns False if a marker is missing.
+    """
+    start_marker = start_marker.encode('utf-8')
+    end_marker = end_marker.encode('utf-8')
+    tmp_path = file_path + '.tmp'
+
+    with open(file_path, 'rb') as src, mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start_idx = mm.find(start_marker)
+        end_idx = mm.find(end_marker)
+
+        if start_idx == -1 or end_idx == -1:
+            return False
+
+        try:
+            with open(tmp_path, 'wb') as dst, memoryview(mm) as view:
+                dst.write(view[:start_idx + len(start_marker)])
+                dst.write(block.encode('utf-8'))
+                dst.write(view[end_idx:])
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    os.replace(tmp_path, file_path)
+    return True
+
+
+def replace_drawable_references(content, suffix):
+    def replace(match):
+        drawable_name = match.group(1)
+        new_drawable_name = drawable_name + suffix
+        LOGGER.debug("Replacing %s with %s", drawable_name, new_drawable_name)
+        return f"@drawable/{new_drawable_name}"
+
+    return _DRAWABLE_REF_RE.sub(replace, content)
+
+
+def update_drawable_references(tree):
+    try:
+        LOGGER.info("Updating drawable references...")
+
+        for _, _, packages in tree:
+            for _, _, suffix, files in packages:
+                for file_path, _, ext, _ in files:
+                    if ext != '.xml':
+                        continue
+
+                    with open(file_path, 'r') as f:
+                        file_content = f.read()
+
+                    if '@drawable/' not in file_content:
+                        continue
+
+                    updated_content = replace_drawable_references(file_content, suffix)
+
+                    if updated_content != file_content:
+                        with open(file_path, 'w') as f:
+                            f.write(updated_content)
+
+                        LOGGER.info("Updated drawable references in: %s", file_path)
+
+        LOGGER.info("Drawable references updated successfully.")
     except Exception as e:
-        LOGGER.error("Error in file copy and rename process: %s", str(e))
+        LOGGER.error("Error updating drawable references: %s", str(e))
         sys.exit(1)
 
 
-def update_manifest():
-    try:
-        LOGGER.info("Updating manifest file: %s", manifest_file)
-        with open(manifest_file, 'r') as f:
-            manifest_content = f.read()
+def copy_pack(pack, executor):
+    """Submit a copy of every drawable in the pack and return the futures."""
+    pack_name, pack_name_lower, packages = pack
+    LOGGER.info("Processing pack: %s (%s)", pack_name, pack_name_lower)
+    futures = []
 
-        start_comment = '<!-- START OF ICON PACKS -->'
-        end_comment = '<!-- END OF ICON PACKS -->'
-        start_idx = manifest_content.find(start_comment)
-        end_idx = manifest_content.find(end_comment)
+    for _, _, _, files in packages:
+        for original_file_path, _, ext, new_name in files:
+            new_file_path = drawable_dir + '/' + new_name + ext
+            LOGGER.debug("Copying %s to %s", original_file_path, new_file_path)
+            futures.append(executor.submit(link_or_copy, original_file_path, new_file_path))
+
+    return futures
 
-        if start_idx == -1 or end_idx == -1:
-            LOGGER.error("Error: Comment markers not found in manifest file.")
-            sys.exit(1)
 
-        activities = ""
-        for pack_name in get_icon_packs():
-            pack_name_lower = re.sub(r'[^a-zA-Z0-9]', '_', pack_name.lower())
-            activities += f"""
+def append_manifest(pack, parts):
+    pack_name, pack_name_lower, _ = pack
+    parts.append(f"""
     <activity android:name="{pack_name_lower}"
         android:label="{pack_name}"
         android:exported="true">
@@ -151,85 +263,95 @@ def update_manifest():
             <category android:name="android.intent.category.DEFAULT" />
         </intent-filter>
     </activity>
-"""
+""")
 
-        new_manifest_content = (
-            manifest_content[:start_idx + len(start_comment)] +
-            activities +
-            manifest_content[end_idx:]
-        )
 
-        with open(manifest_file, 'w') as f:
-            f.write(new_manifest_content)
-        
-        LOGGER.info("Manifest file updated successfully.")
-    except Exception as e:
-        LOGGER.error("Error updating manifest: %s", str(e))
-        sys.exit(1)
+def append_arrays(pack, parts):
+    _, pack_name_lower, packages = pack
+    parts.append(f"""
+<string-array name="{pack_name_lower}">
+    <item>mapping_source_{pack_name_lower}</item>
+    <item>replacement_{pack_name_lower}</item>
+</string-array>
+""")
+
+    mapping_items = []
+    replacement_items = []
+    for _, raw_package_name, _, files in packages:
+        for _, stem, _, new_name in files:
+            mapping_items.append(f"    <item>{raw_package_name}:{stem}</item>\n")
+            replacement_items.append(f"    <item>{new_name}</item>\n")
+
+    parts.append(f"""
+<string-array name="mapping_source_{pack_name_lower}">
+""")
+    parts.append("".join(mapping_items))
+    parts.append("</string-array>\n")
+
+    parts.append(f"""
+<string-array name="replacement_{pack_name_lower}">
+""")
+    parts.append("".join(replacement_items))
+    parts.append("</string-array>\n")
+
 
+def process_packs(tree):
+    """Copy drawables and collect manifest and arrays output in one pass."""
+    manifest_parts = []
+    array_parts = []
 
-def update_arrays():
     try:
-        LOGGER.info("Updating arrays file: %s", arrays_file)
-        with open(arrays_file, 'r') as f:
-            arrays_content = f.read()
+        LOGGER.info("Starting file copy and rename process...")
 
-        start_resources = arrays_content.find('<resources>')
-        end_resources = arrays_content.find('</resources>')
+        # Ensure the destination directory exists
+        if not os.path.exists(drawable_dir):
+            os.makedirs(drawable_dir)
+            LOGGER.info("Created drawable directory: %s", drawable_dir)
 
-        if start_resources == -1 or end_resources == -1:
-            LOGGER.error("Error: <resources> tags not found in arrays file.")
-            sys.exit(1)
+        pack_futures = []
+        with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+            for pack in tree:
+                pack_futures.append((pack[0], copy_pack(pack, executor)))
+                append_manifest(pack, manifest_parts)
+                append_arrays(pack, array_parts)
 
-        array_updates = ""
+            for pack_name, futures in pack_futures:
+                for future in futures:
+                    future.result()
 
-        for pack_name in get_icon_packs():
-            pack_name_lower = re.sub(r'[^a-zA-Z0-9]', '_', pack_name.lower())
+                LOGGER.info("Copied %d files for pack %s", len(futures), pack_name)
 
-            array_updates += f"""
-<string-array name="{pack_name_lower}">
-    <item>mapping_source_{pack_name_lower}</item>
-    <item>replacement_{pack_name_lower}</item>
-</string-array>
-"""
+        LOGGER.info("File copy and rename process completed.")
+    except Exception as e:
+        LOGGER.error("Error in file copy and rename process: %s", str(e))
+        sys.exit(1)
 
-            array_updates += f"""
-<string-array name="mapping_source_{pack_name_lower}">
-"""
-            pack_path = os.path.join(iconpacks_dir, pack_name)
-            for package_name in os.listdir(pack_path):
-                package_path = os.path.join(pack_path, package_name)
+    return "".join(manifest_parts), "".join(array_parts)
 
-                if os.path.isdir(package_path):
-                    for file in os.listdir(package_path):
-                        file_extension = os.path.splitext(file)[1].lower()
 
-                        if file_extension in VALID_DRAWABLE_EXTENSIONS:
-                            array_updates += f"    <item>{package_name}:{os.path.splitext(file)[0]}</item>\n"
-            array_updates += f"</string-array>\n"
+def update_manifest(activities):
+    try:
+        LOGGER.info("Updating manifest file: %s", manifest_file)
 
-            array_updates += f"""
-<string-array name="replacement_{pack_name_lower}">
-"""
-            for package_name in os.listdir(pack_path):
-                package_path = os.path.join(pack_path, package_name)
+        if not splice_file(manifest_file, '<!-- START OF ICON PACKS -->', '<!-- END OF ICON PACKS -->', activities):
+            LOGGER.error("Error: Comment markers not found in manifest file.")
+            sys.exit(1)
 
-                if os.path.isdir(package_path):
-                    package_name = normalize_package_name(package_name)
+        LOGGER.info("Manifest file updated successfully.")
+    except Exception as e:
+        LOGGER.error("Error updating manifest: %s", str(e))
+        sys.exit(1)
 
-                    for file in os.listdir(package_path):
-                        file_extension = os.path.splitext(file)[1].lower()
 
-                        if file_extension in VALID_DRAWABLE_EXTENSIONS:
-                            new_name = f"{os.path.splitext(file)[0]}_{package_name.lower()}_{pack_name_lower}"
-                            array_updates += f"    <item>{new_name}</item>\n"
-            array_updates += f"</string-array>\n"
+def update_arrays(array_updates, tree_hash):
+    try:
+        LOGGER.info("Updating arrays file: %s", arrays_file)
+        array_updates += f"<!-- hash: {tree_hash} -->\n"
 
-        new_arrays_content = arrays_content[:start_resources + len('<resources>')] + array_updates + arrays_content[end_resources:]
+        if not splice_file(arrays_file, '<resources>', '</resources>', array_updates):
+            LOGGER.error("Error: <resources> tags not found in arrays file.")
+            sys.exit(1)
 
-        with open(arrays_file, 'w') as f:
-            f.write(new_arrays_content)
-        
         LOGGER.info("Arrays file updated successfully.")
     except Exception as e:
         LOGGER.error("Error updating arrays file: %s", str(e))
@@ -238,9 +360,18 @@ def update_arrays():
 
 def main():
     LOGGER.info("Starting the automation process...")
-    copy_and_rename_files()
-    update_manifest()
-    update_arrays()
+    tree = _scan_tree()
+
+    if read_tree_hash() == hash_tree(tree) and drawables_present(tree):
+        LOGGER.info("Icon packs unchanged, skipping.")
+        return
+
+    update_drawable_references(tree)
+    # Hash after the in-place reference rewrite so an untouched tree matches next run
+    tree_hash = hash_tree(tree)
+    activities, array_updates = process_packs(tree)
+    update_manifest(activities)
+    update_arrays(array_updates, tree_hash)
     LOGGER.info("Automation process completed successfully.")
 
 